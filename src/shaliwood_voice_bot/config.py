@@ -1,4 +1,6 @@
+import functools
 import os
+import tempfile
 from pathlib import Path
 from typing import Optional
 from dotenv import load_dotenv
@@ -7,8 +9,9 @@ class ConfigError(Exception):
     """Raised when there's an error in the configuration."""
     pass
 
+@functools.lru_cache(maxsize=1)
 def load_config() -> None:
-    """Load environment variables from .env file if it exists."""
+    """Load environment variables from .env file if it exists (only once per process)."""
     env_path = Path('.env')
     if env_path.exists():
         load_dotenv(env_path)
@@ -54,14 +57,29 @@ OPENAI_API_KEY = get_required_env('OPENAI_API_KEY')
 # Google Sheets configuration
 GOOGLE_SHEETS_CREDENTIALS_FILE = get_optional_env('GOOGLE_SHEETS_CREDENTIALS_FILE', 'credentials.json')
 SPREADSHEET_ID = get_required_env('SPREADSHEET_ID')
+# Marker file recording the day the spreadsheet headers were last verified
+SHEETS_HEADERS_MARKER_FILE = get_optional_env(
+    'SHEETS_HEADERS_MARKER_FILE', os.path.join(tempfile.gettempdir(), 'shaliwood_sheets_headers')
+)
 
 # Optional environment variables
 LOG_LEVEL = get_optional_env('LOG_LEVEL', 'INFO')
 
+# Transcription backend: 'openai' (hosted Whisper API) or 'local' (faster-whisper)
+WHISPER_BACKEND = get_optional_env('WHISPER_BACKEND', 'openai').lower()
+LOCAL_WHISPER_MODEL = get_optional_env('LOCAL_WHISPER_MODEL', 'small')
+# Device for the local model: 'cpu', 'cuda' or 'auto' (CUDA when available)
+LOCAL_WHISPER_DEVICE = get_optional_env('LOCAL_WHISPER_DEVICE', 'auto').lower()
+# Re-encode large voice uploads with ffmpeg before sending them to the Whisper API
+COMPRESS_WHISPER_UPLOADS = get_optional_env('COMPRESS_WHISPER_UPLOADS', 'false').lower() == 'true'
+
 # Voice message saving configuration
 SAVE_VOICE_MESSAGES = get_optional_env('SAVE_VOICE_MESSAGES', 'false').lower() == 'true'
 VOICE_SAVE_DIR = get_optional_env('VOICE_SAVE_DIR', 'voice_messages')
 
+# File the bot keeps its transcription cache in across restarts (unset: memory only)
+TRANSCRIPTION_CACHE_FILE = get_optional_env('TRANSCRIPTION_CACHE_FILE')
+
 # Webhook configuration
 WEBHOOK_URL = get_optional_env('WEBHOOK_URL')
 WEBHOOK_PORT = int(get_optional_env('WEBHOOK_PORT', '8443'))
@@ -3,32 +3,53 @@ Cron-based message processor for Shaliwood Voice Bot.
 Fetches recent messages from Telegram and processes them in batch.
 Note: Only messages from the last 24 hours are accessible due to Telegram API limitations.
 """
+import bisect
+import functools
 import logging
 import asyncio
-import tempfile
-import os
-from datetime import datetime, timedelta
+import time
+from collections import defaultdict
+from datetime import datetime
 from typing import List, Dict, Any, Optional
 from telegram import Bot, Update
 from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
 from .config import TELEGRAM_TOKEN, SAVE_VOICE_MESSAGES
 from .voice_processor import VoiceProcessor
 from .data_manager import DataManager
-from .response_formatter import ResponseFormatter
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of concurrent voice file downloads (keeps clear of Telegram flood limits)
+DOWNLOAD_CONCURRENCY = 8
+
+# Upper bounds (seconds) of the voice duration buckets: 0-5s, 5-15s, 15-30s and 30s+
+DURATION_BUCKETS = (5, 15, 30)
+
+# Maximum number of similar-length recordings sent to the voice processor together
+TRANSCRIPTION_BATCH_SIZE = 8
+
+# Voice messages shorter or smaller than this are empty recordings and are skipped
+MIN_VOICE_DURATION = 1
+MIN_VOICE_FILE_SIZE = 2048
+
+# Shared bot whose HTTP/2 connection pool is reused by every Telegram call in the process
+_BOT = Bot(
+    token=TELEGRAM_TOKEN,
+    request=HTTPXRequest(http_version="2", connection_pool_size=32, pool_timeout=5.0)
+)
+
 
 class CronMessageProcessor:
     """Handles batch processing of recent Telegram messages via cron job."""
     
-    def __init__(self, voice_processor: VoiceProcessor, data_manager: DataManager, response_formatter: ResponseFormatter):
+    def __init__(self, voice_processor: VoiceProcessor, data_manager: DataManager):
         """Initialize the cron message processor."""
         self.voice_processor = voice_processor
         self.data_manager = data_manager
-        self.response_formatter = response_formatter
-        self.bot = Bot(token=TELEGRAM_TOKEN)
+        self.bot = _BOT
         self.last_processed_update_id = 0
+        self._pending_rows = []
         
     async def fetch_and_process_recent_messages(self, hours_back: int = 24) -> Dict[str, Any]:
         """
@@ -50,24 +71,24 @@ class CronMessageProcessor:
         }
         
         try:
-            logger.info(f"Starting cron message processing for last {hours_back} hours")
+            logger.info("Starting cron message processing for last %s hours", hours_back)
             
-            # Fetch recent updates
-            updates = await self._fetch_recent_updates()
+            # Fetch recent updates while the voice processor warms up
+            updates, _ = await asyncio.gather(
+                self._fetch_recent_updates(hours_back),
+                self.voice_processor.warmup()
+            )
             if not updates:
                 logger.info("No recent updates found")
                 return stats
             
             stats['total_messages'] = len(updates)
-            logger.info(f"Found {len(updates)} recent updates")
+            logger.info("Found %s recent updates", len(updates))
             
-            # Process each update
-            for update in updates:
-                try:
-                    await self._process_single_update(update, stats)
-                except Exception as e:
-                    logger.warning(f"Error processing update {update.update_id}: {e}")
-                    stats['errors'] += 1
+            # Collect voice messages, then download and transcribe them as one batch
+            voice_messages = self._collect_voice_messages(updates, stats)
+            if voice_messages:
+                await self._process_voice_messages(voice_messages, stats)
             
             # Update last processed update ID
             if updates:
@@ -76,16 +97,16 @@ class CronMessageProcessor:
             stats['end_time'] = datetime.now()
             stats['duration'] = (stats['end_time'] - stats['start_time']).total_seconds()
             
-            logger.info(f"Cron processing completed: {stats['processed_voice']} voice messages processed, {stats['errors']} errors")
+            logger.info("Cron processing completed: %s voice messages processed, %s errors", stats['processed_voice'], stats['errors'])
             
         except Exception as e:
-            logger.error(f"Error in cron message processing: {e}")
+            logger.error("Error in cron message processing: %s", e)
             stats['errors'] += 1
             
         return stats
     
-    async def _fetch_recent_updates(self) -> List[Update]:
-        """Fetch recent updates from Telegram."""
+    async def _fetch_recent_updates(self, hours_back: int = 24) -> List[Update]:
+        """Fetch updates from Telegram that arrived within the last hours_back hours."""
         try:
             # Use offset to avoid processing the same messages multiple times
             offset = self.last_processed_update_id + 1 if self.last_processed_update_id > 0 else None
@@ -97,111 +118,176 @@ class CronMessageProcessor:
                 allowed_updates=['message']  # Only fetch messages
             )
             
-            # Filter for messages from the last 24 hours
-            cutoff_time = datetime.now() - timedelta(hours=24)
-            recent_updates = []
-            
-            for update in updates:
-                if update.message and update.message.date:
-                    if update.message.date > cutoff_time:
-                        recent_updates.append(update)
-            
-            return recent_updates
+            # Filter for messages from the requested window. Message dates are
+            # timezone-aware, so compare POSIX timestamps rather than datetimes
+            cutoff_ts = time.time() - hours_back * 3600
+            return [
+                update for update in updates
+                if update.message and update.message.date and update.message.date.timestamp() > cutoff_ts
+            ]
             
         except TelegramError as e:
-            logger.error(f"Telegram API error fetching updates: {e}")
+            logger.error("Telegram API error fetching updates: %s", e)
             return []
     
-    async def _process_single_update(self, update: Update, stats: Dict[str, Any]):
-        """Process a single update (message)."""
-        if not update.message:
-            return
+    def _collect_voice_messages(self, updates: List[Update], stats: Dict[str, Any]) -> list:
+        """Collect the voice messages from a list of updates."""
+        voice_messages = []
         
-        message = update.message
+        for update in updates:
+            message = update.message
+            if not message:
+                continue
+            
+            if message.voice:
+                stats['voice_messages'] += 1
+                if self._is_empty_recording(message.voice):
+                    logger.info("Skipping empty voice message from user %s", message.from_user.id if message.from_user else 'unknown')
+                    continue
+                voice_messages.append(message)
+            else:
+                # Log other message types for debugging
+                logger.debug("Non-voice message from user %s", message.from_user.id if message.from_user else 'unknown')
         
-        # Process voice messages
-        if message.voice:
-            stats['voice_messages'] += 1
-            await self._process_voice_message(message, stats)
-        else:
-            # Log other message types for debugging
-            logger.debug(f"Non-voice message from user {message.from_user.id if message.from_user else 'unknown'}")
+        return voice_messages
     
-    async def _process_voice_message(self, message, stats: Dict[str, Any]):
-        """Process a voice message."""
-        temp_file_path = None
-        
-        try:
-            logger.info(f"Processing voice message from user {message.from_user.id if message.from_user else 'unknown'}")
-            
-            # Download voice file
+    def _is_empty_recording(self, voice) -> bool:
+        """Check whether a voice message is too short or small to hold any speech."""
+        if (voice.duration or 0) < MIN_VOICE_DURATION:
+            return True
+        return voice.file_size is not None and voice.file_size < MIN_VOICE_FILE_SIZE
+    
+    async def _download_voice(self, message, semaphore: asyncio.Semaphore) -> bytes:
+        """Download a voice message into memory."""
+        async with semaphore:
+            logger.info("Processing voice message from user %s", message.from_user.id if message.from_user else 'unknown')
             file = await self.bot.get_file(message.voice.file_id)
             
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".ogg")
-            temp_file_path = temp_file.name
-            temp_file.close()
-            
-            await file.download_to_drive(temp_file_path)
-            logger.info(f"Voice file downloaded: {temp_file_path}")
+            audio_bytes = bytes(await file.download_as_bytearray())
+        
+        logger.info("Voice file downloaded: %s bytes", len(audio_bytes))
+        return audio_bytes
+    
+    async def _process_voice_messages(self, messages: list, stats: Dict[str, Any]):
+        """Download a batch of voice messages and process them together."""
+        downloaded = []
+        
+        # Download phase - all files are fetched concurrently
+        semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+        download_results = await asyncio.gather(
+            *[self._download_voice(message, semaphore) for message in messages],
+            return_exceptions=True
+        )
+        
+        for message, result in zip(messages, download_results):
+            if isinstance(result, BaseException):
+                logger.error("Error downloading voice message: %s", result)
+                stats['errors'] += 1
+            else:
+                downloaded.append((message, result))
+        
+        if not downloaded:
+            return
+        
+        # Transcription phase - similar-length recordings are batched together and
+        # all batches run at once, bounded by the voice processor's semaphore
+        await asyncio.gather(*[
+            self._transcribe_batch(batch, stats) for batch in self._bucket_by_duration(downloaded)
+        ])
+        
+        # Write the whole batch to sheets at once
+        await self._flush_pending_rows()
+    
+    def _bucket_by_duration(self, downloaded: list) -> List[list]:
+        """
+        Group downloaded voice messages into batches of similar duration.
+        
+        Telegram reports the duration of every voice message, so short clips are
+        never batched with long reports and left waiting for them.
+        
+        Args:
+            downloaded: List of (message, audio_bytes) pairs
             
-            # Extract message date for reference
-            message_date = message.date
-            reference_date = message_date.strftime('%d/%m/%Y') if message_date else None
+        Returns:
+            List of batches, each holding at most TRANSCRIPTION_BATCH_SIZE pairs
+        """
+        buckets = defaultdict(list)
+        for message, audio_bytes in downloaded:
+            duration = message.voice.duration or 0
+            buckets[bisect.bisect(DURATION_BUCKETS, duration)].append((message, audio_bytes))
+        
+        return [
+            bucket[start:start + TRANSCRIPTION_BATCH_SIZE]
+            for _, bucket in sorted(buckets.items())
+            for start in range(0, len(bucket), TRANSCRIPTION_BATCH_SIZE)
+        ]
+    
+    async def _transcribe_batch(self, batch: list, stats: Dict[str, Any]):
+        """Transcribe a batch of downloaded voice messages and queue their workday data."""
+        user_infos = [
+            {'user_id': message.from_user.id if message.from_user else 'unknown'}
+            for message, _ in batch
+        ]
+        reference_dates = [
+            message.date.strftime('%d/%m/%Y') if message.date else None
+            for message, _ in batch
+        ]
+        results = await self.voice_processor.process_audio_batch(
+            [audio_bytes for _, audio_bytes in batch], user_infos,
+            save_for_testing=SAVE_VOICE_MESSAGES, reference_dates=reference_dates
+        )
+        
+        # Persistence phase - rows are queued here and written once every batch is done
+        for (message, _), user_info, reference_date, (success, text, workday_data) in zip(
+            batch, user_infos, reference_dates, results
+        ):
+            try:
+                if success:
+                    # Handle workday data
+                    self._handle_workday_data_cron(message, workday_data, text)
+                    stats['processed_voice'] += 1
+                    
+                    # Add to processed messages list
+                    stats['messages_processed'].append({
+                        'user_id': user_info['user_id'],
+                        'message_date': reference_date,
+                        'transcription': text[:100] + "..." if text and len(text) > 100 else text,
+                        'has_workday_data': bool(workday_data)
+                    })
+                    
+                    logger.info("Successfully processed voice message from user %s", user_info['user_id'])
+                else:
+                    logger.warning("Failed to process voice message from user %s", user_info['user_id'])
+            except Exception as e:
+                logger.error("Error processing voice message: %s", e)
+                stats['errors'] += 1
+    
+    def _handle_workday_data_cron(self, message, workday_data: dict, raw_transcription: str = None):
+        """Queue workday data for the batched sheets write (cron job sends no responses)."""
+        if workday_data:
+            # Get reference date from the message
+            reference_date = None
+            if message.date:
+                reference_date = message.date.strftime('%d/%m/%Y')
             
-            # Process audio using voice processor
-            user_info = {'user_id': message.from_user.id if message.from_user else 'unknown'}
-            success, text, workday_data = self.voice_processor.process_audio(
-                temp_file_path, user_info, save_for_testing=SAVE_VOICE_MESSAGES, reference_date=reference_date
-            )
+            self._pending_rows.append((workday_data, raw_transcription, reference_date))
+    
+    async def _flush_pending_rows(self):
+        """Write all queued workday data to sheets in a single request."""
+        if not self._pending_rows:
+            return
+        
+        rows, self._pending_rows = self._pending_rows, []
+        try:
+            sheets_saved = await asyncio.to_thread(self.data_manager.save_workday_data_bulk, rows)
             
-            if success:
-                # Handle workday data
-                await self._handle_workday_data_cron(message, workday_data, text)
-                stats['processed_voice'] += 1
-                
-                # Add to processed messages list
-                stats['messages_processed'].append({
-                    'user_id': user_info['user_id'],
-                    'message_date': reference_date,
-                    'transcription': text[:100] + "..." if text and len(text) > 100 else text,
-                    'has_workday_data': bool(workday_data)
-                })
-                
-                logger.info(f"Successfully processed voice message from user {user_info['user_id']}")
+            if sheets_saved:
+                logger.info("Workday data saved to sheets for %s voice messages", len(rows))
             else:
-                logger.warning(f"Failed to process voice message from user {user_info['user_id']}")
-                
+                logger.warning("Failed to save workday data to sheets for %s voice messages", len(rows))
+            
         except Exception as e:
-            logger.error(f"Error processing voice message: {e}")
-            stats['errors'] += 1
-        finally:
-            # Clean up temporary file
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                except Exception as e:
-                    logger.warning(f"Failed to clean up temporary file: {e}")
-    
-    async def _handle_workday_data_cron(self, message, workday_data: dict, raw_transcription: str = None):
-        """Handle workday data processing for cron job (without sending responses)."""
-        if workday_data:
-            try:
-                # Get reference date from the message
-                reference_date = None
-                if message.date:
-                    reference_date = message.date.strftime('%d/%m/%Y')
-                
-                # Try to save to sheets
-                sheets_available = self.data_manager.is_sheets_available()
-                sheets_saved = self.data_manager.save_workday_data(workday_data, raw_transcription, recording_date=reference_date)
-                
-                if sheets_saved:
-                    logger.info(f"Workday data saved to sheets for user {message.from_user.id if message.from_user else 'unknown'}")
-                else:
-                    logger.warning(f"Failed to save workday data to sheets for user {message.from_user.id if message.from_user else 'unknown'}")
-                
-            except Exception as e:
-                logger.error(f"Error saving workday data: {e}")
+            logger.error("Error saving workday data: %s", e)
     
     def get_processing_stats(self) -> Dict[str, Any]:
         """Get current processing statistics."""
@@ -213,30 +299,37 @@ class CronMessageProcessor:
         }
 
 
+@functools.lru_cache(maxsize=1)
+def _components():
+    """Build the processing components once per process and reuse them across runs."""
+    return VoiceProcessor(), DataManager()
+
+
 async def run_cron_processing():
     """Main function to run cron processing."""
-    from .voice_processor import VoiceProcessor
-    from .data_manager import DataManager
-    from .response_formatter import ResponseFormatter
-    
     # Initialize components
-    voice_processor = VoiceProcessor()
-    data_manager = DataManager()
-    response_formatter = ResponseFormatter()
+    voice_processor, data_manager = _components()
     
     # Create processor
-    processor = CronMessageProcessor(voice_processor, data_manager, response_formatter)
+    processor = CronMessageProcessor(voice_processor, data_manager)
     
-    # Run processing
-    stats = await processor.fetch_and_process_recent_messages()
+    # Run processing on an initialized bot, releasing its connections afterwards.
+    # The cached voice processor drops its loop-bound state (OpenAI connection
+    # pool, semaphore) too, so a later run on a new event loop rebuilds it
+    await _BOT.initialize()
+    try:
+        stats = await processor.fetch_and_process_recent_messages()
+    finally:
+        await _BOT.shutdown()
+        await voice_processor.aclose()
     
     # Log results
     logger.info("Cron processing completed:")
-    logger.info(f"  - Total messages: {stats['total_messages']}")
-    logger.info(f"  - Voice messages: {stats['voice_messages']}")
-    logger.info(f"  - Processed voice: {stats['processed_voice']}")
-    logger.info(f"  - Errors: {stats['errors']}")
-    logger.info(f"  - Duration: {stats.get('duration', 0):.2f} seconds")
+    logger.info("  - Total messages: %s", stats['total_messages'])
+    logger.info("  - Voice messages: %s", stats['voice_messages'])
+    logger.info("  - Processed voice: %s", stats['processed_voice'])
+    logger.info("  - Errors: %s", stats['errors'])
+    logger.info("  - Duration: %.2f seconds", stats.get('duration', 0))
     
     return stats
 
@@ -1,115 +1,67 @@
+import functools
 import logging
 from typing import Dict, Any, Optional
-from openai import OpenAI
+import httpx
+import orjson
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from .config import OPENAI_API_KEY
-import json
-from datetime import datetime
+import re
+from datetime import date, datetime
 
 logger = logging.getLogger(__name__)
 
-# Simple custom exception
-class DataExtractionError(Exception):
-    """Raised when data extraction fails."""
-    pass
+# Model used for structured data extraction
+EXTRACTION_MODEL = "gpt-4o-mini"
 
-class WorkdayDataExtractor:
-    """
-    AI-powered workday data extractor.
-    """
-    
-    def __init__(self):
-        """
-        Initialize the data extractor.
-        
-        Raises:
-            DataExtractionError: If initialization fails
-        """
-        try:
-            self.client = OpenAI(api_key=OPENAI_API_KEY)
-            logger.info("Workday data extractor initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize workday data extractor: {e}")
-            raise DataExtractionError(f"Data extractor initialization failed: {e}")
-    
-    def extract_workday_data(self, transcribed_text: str, reference_date: str = None) -> Dict[str, Any]:
-        """
-        Extract structured workday data from transcribed Hebrew text.
-        
-        Args:
-            transcribed_text: The transcribed Hebrew text describing the workday
-            reference_date: Reference date in DD/MM/YYYY format for resolving relative expressions
-            
-        Returns:
-            Dictionary containing structured workday data
-            
-        Raises:
-            DataExtractionError: If extraction fails
-        """
-        try:
-            if not transcribed_text or not transcribed_text.strip():
-                raise DataExtractionError("Empty or invalid transcribed text provided")
-            
-            # Use current date as fallback if no reference date provided
-            if not reference_date:
-                reference_date = datetime.now().strftime('%d/%m/%Y')
-                logger.info(f"No reference date provided, using current date: {reference_date}")
-            else:
-                logger.info(f"Using provided reference date for extraction: {reference_date}")
-            
-            # Create a prompt for OpenAI to extract structured data
-            prompt = self._create_extraction_prompt(transcribed_text, reference_date)
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "אתה מומחה בחילוץ מידע מובנה מטקסטים בעברית עבור חברות בנייה. תמיד החזר תשובה בפורמט JSON תקף."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.0,
-                max_tokens=1000
-            )
+# Fields the model is asked to extract ('day' is derived from the date afterwards)
+_SCHEMA_FIELDS = (
+    'date', 'start_time', 'end_time', 'project_name', 'sub_project',
+    'work_description', 'workers', 'additional_notes'
+)
 
-            # Extract the JSON response
-            content = response.choices[0].message.content.strip()
-            
-            # Parse and validate the response
-            workday_data = self._parse_json_response(content)
-            validated_data = self._validate_and_clean_data(workday_data)
-            
-            logger.info("Successfully extracted workday data from transcription")
-            return validated_data
-                
-        except Exception as e:
-            logger.error(f"Error extracting workday data: {e}")
-            return self._create_fallback_data(transcribed_text)
-    
+# Structured Outputs schema - the API guarantees a JSON object matching it
+_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "workday_data",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {field: {"type": "string"} for field in _SCHEMA_FIELDS},
+            "required": list(_SCHEMA_FIELDS),
+            "additionalProperties": False
+        }
+    }
+}
 
-    def _create_extraction_prompt(self, text: str, reference_date: str) -> str:
-        """
-        Create the extraction prompt for OpenAI.
-        
-        Args:
-            text: Transcribed text
-            reference_date: Reference date in DD/MM/YYYY format
-            
-        Returns:
-            Formatted prompt string
-        """
-        return f"""
+# Day-first dates: DD/MM/YYYY, DD-MM-YYYY, DD.MM.YYYY, DD/MM/YY, DD-MM-YY
+_DAY_FIRST_DATE_RE = re.compile(r'(\d{1,2})([/.-])(\d{1,2})\2(\d{4}|\d{2})')
+# Year-first dates: YYYY-MM-DD, YY-MM-DD
+_YEAR_FIRST_DATE_RE = re.compile(r'(\d{4}|\d{2})-(\d{1,2})-(\d{1,2})')
+# Times: HH:MM, HH:MM:SS, HH.MM, optionally followed by AM/PM
+_TIME_RE = re.compile(r'(\d{1,2})([:.])(\d{1,2})(?::(\d{1,2}))?(?:\s+([AP]M))?', re.IGNORECASE)
+
+# Prefilter for transcriptions too short to describe a workday
+_MIN_INFORMATIVE_WORDS = 5
+
+# Hebrew day names indexed by date.weekday()
+_HEBREW_DAYS = ('שני', 'שלישי', 'רביעי', 'חמישי', 'שישי', 'שבת', 'ראשון')
+
+# Static parts of the extraction prompt - only the transcription and the
+# reference date change between calls
+_PROMPT_PREFIX = """
         You are an assistant helping a construction company named "Shalevud" that specializes in roofing.
 
         Your task is to extract structured information from a daily work report written in Hebrew.
 
         Input text:  
-        {text}
+        """
 
-        Reference date: {reference_date} (in DD/MM/YYYY format)
+_PROMPT_MID = """
+
+        Reference date: """
+
+_PROMPT_SUFFIX = """ (in DD/MM/YYYY format)
 
         Use the reference date to resolve relative expressions like "אתמול" or "היום".  
         
@@ -146,7 +98,7 @@ class WorkdayDataExtractor:
         Therefore, include `"איתי"` in the `workers` field unless his absence is explicitly mentioned.
 
         Return your output as a JSON object with the following fields:
-        {{
+        {
             "date": "",               // Date in format DD/MM/YYYY — must match the given date
             "start_time": "",         // Start time in HH:MM (24-hour format)
             "end_time": "",           // End time in HH:MM (24-hour format) 
@@ -156,13 +108,185 @@ class WorkdayDataExtractor:
             "workers": "",            // Names of workers who worked today, comma-separated (in Hebrew, without titles)
             "additional_notes": ""    // Any additional comments, issues, or problems encountered
 
-        }}
+        }
 
         Important:
         - Return only the JSON object. No explanations, no formatting, no extra text.
         - All field values must be in Hebrew. Do not translate or transliterate anything to English.
         - Always include "איתי" in the workers field unless it is explicitly said he was not present.
         """
+
+# Keep-alive pool shared by all OpenAI requests (transcription and extraction)
+_HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+# Per-request timeout in seconds; voice messages are short, so this is generous
+_HTTP_TIMEOUT = 60.0
+
+@functools.lru_cache(maxsize=1)
+def get_async_openai_client() -> AsyncOpenAI:
+    """Return the process-wide AsyncOpenAI client, creating it on first use."""
+    return AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        timeout=_HTTP_TIMEOUT,
+        http_client=DefaultAsyncHttpxClient(http2=True, limits=_HTTP_LIMITS)
+    )
+
+async def close_async_openai_client():
+    """
+    Close the process-wide AsyncOpenAI client's connections, if it was created.
+    
+    The cache is cleared as well, so the next get_async_openai_client() call
+    builds a fresh client (e.g. for a later run on a new event loop).
+    """
+    if get_async_openai_client.cache_info().currsize:
+        client = get_async_openai_client()
+        get_async_openai_client.cache_clear()
+        await client.close()
+
+# Simple custom exception
+class DataExtractionError(Exception):
+    """Raised when data extraction fails."""
+    pass
+
+class FallbackWorkdayData(dict):
+    """Workday data built from the raw text because no extraction succeeded; not worth caching."""
+
+class WorkdayDataExtractor:
+    """
+    AI-powered workday data extractor.
+    """
+    
+    def __init__(self):
+        """Initialize the data extractor; requests go through the shared async OpenAI client."""
+        logger.info("Workday data extractor initialized successfully")
+    
+    async def extract_workday_data_async(self, transcribed_text: str, reference_date: str = None) -> Dict[str, Any]:
+        """
+        Extract structured workday data from transcribed Hebrew text.
+        
+        Uses the AsyncOpenAI client, so callers can run many extractions
+        concurrently on one event loop.
+        
+        Args:
+            transcribed_text: The transcribed Hebrew text describing the workday
+            reference_date: Reference date in DD/MM/YYYY format for resolving relative expressions
+            
+        Returns:
+            Dictionary containing structured workday data
+        """
+        try:
+            request = self._build_completion_request(transcribed_text, reference_date)
+            if request is None:
+                return self._create_fallback_data(transcribed_text, reference_date)
+            
+            response = await get_async_openai_client().chat.completions.create(**request)
+            return self._handle_completion(response)
+                
+        except Exception as e:
+            logger.error("Error extracting workday data: %s", e)
+            logger.warning("Using fallback data structure due to extraction failure")
+            return self._create_fallback_data(transcribed_text, reference_date)
+    
+    async def warmup_async(self):
+        """Open the async client's connection to the API with a free metadata request."""
+        await get_async_openai_client().models.list()
+    
+    def _build_completion_request(self, transcribed_text: str, reference_date: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Build the chat completion arguments for a transcription.
+        
+        Args:
+            transcribed_text: The transcribed Hebrew text describing the workday
+            reference_date: Reference date in DD/MM/YYYY format
+            
+        Returns:
+            Keyword arguments for chat.completions.create, or None when the
+            text is not worth an extraction call
+            
+        Raises:
+            DataExtractionError: If the transcribed text is empty
+        """
+        if not transcribed_text or not transcribed_text.strip():
+            raise DataExtractionError("Empty or invalid transcribed text provided")
+        
+        # Skip the OpenAI call for messages too short to be work reports
+        if not self._is_informative(transcribed_text):
+            logger.info("Transcription too short for a work report, skipping AI extraction")
+            return None
+        
+        # Use current date as fallback if no reference date provided
+        if not reference_date:
+            reference_date = datetime.now().strftime('%d/%m/%Y')
+            logger.info("No reference date provided, using current date: %s", reference_date)
+        else:
+            logger.info("Using provided reference date for extraction: %s", reference_date)
+        
+        # Create a prompt for OpenAI to extract structured data
+        prompt = self._create_extraction_prompt(transcribed_text, reference_date)
+        
+        return {
+            "model": EXTRACTION_MODEL,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "אתה מומחה בחילוץ מידע מובנה מטקסטים בעברית עבור חברות בנייה. תמיד החזר תשובה בפורמט JSON תקף."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "temperature": 0.0,
+            "max_tokens": 1000,
+            "response_format": _RESPONSE_FORMAT
+        }
+    
+    def _handle_completion(self, response) -> Dict[str, Any]:
+        """
+        Parse and validate a chat completion response.
+        
+        Args:
+            response: Chat completion returned by OpenAI
+            
+        Returns:
+            Cleaned and validated workday data
+        """
+        # Extract the JSON response
+        content = response.choices[0].message.content.strip()
+        
+        # Parse and validate the response
+        workday_data = self._parse_json_response(content)
+        validated_data = self._validate_and_clean_data(workday_data)
+        
+        logger.info("Successfully extracted workday data from transcription")
+        return validated_data
+    
+    def _is_informative(self, text: str) -> bool:
+        """
+        Check whether a transcription may describe a workday.
+        
+        Args:
+            text: Transcribed text
+            
+        Only the length is checked: work reports are phrased too freely for a
+        keyword list to recognize them reliably.
+        
+        Returns:
+            bool: False for text too short to be worth an extraction call
+        """
+        return len(text.split()) >= _MIN_INFORMATIVE_WORDS
+    
+    def _create_extraction_prompt(self, text: str, reference_date: str) -> str:
+        """
+        Create the extraction prompt for OpenAI.
+        
+        Args:
+            text: Transcribed text
+            reference_date: Reference date in DD/MM/YYYY format
+            
+        Returns:
+            Formatted prompt string
+        """
+        return _PROMPT_PREFIX + text + _PROMPT_MID + reference_date + _PROMPT_SUFFIX
     
     def _parse_json_response(self, content: str) -> Dict[str, Any]:
         """
@@ -178,21 +302,15 @@ class WorkdayDataExtractor:
             DataExtractionError: If parsing fails
         """
         try:
-            # Remove any markdown formatting if present
-            if content.startswith('```json'):
-                content = content[7:]
-            if content.endswith('```'):
-                content = content[:-3]
-            
-            workday_data = json.loads(content.strip())
+            workday_data = orjson.loads(content)
             return workday_data
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response: {e}")
-            logger.error(f"Raw response: {content}")
+        except orjson.JSONDecodeError as e:
+            logger.error("Failed to parse JSON response: %s", e)
+            logger.error("Raw response: %s", content)
             raise DataExtractionError(f"JSON parsing failed: {e}")
         except Exception as e:
-            logger.error(f"Unexpected error parsing JSON: {e}")
+            logger.error("Unexpected error parsing JSON: %s", e)
             raise DataExtractionError(f"JSON parsing failed: {e}")
     
     def _validate_and_clean_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -228,8 +346,7 @@ class WorkdayDataExtractor:
         
         # Extract day from date
         date_obj = datetime.strptime(cleaned_data['date'], '%d/%m/%Y')
-        hebrew_days = ['שני', 'שלישי', 'רביעי', 'חמישי', 'שישי', 'שבת', 'ראשון']
-        cleaned_data['day'] = hebrew_days[date_obj.weekday()]
+        cleaned_data['day'] = _HEBREW_DAYS[date_obj.weekday()]
 
         return cleaned_data
     
@@ -237,6 +354,9 @@ class WorkdayDataExtractor:
         """
         Format date string to DD/MM/YYYY format.
         
+        Accepts DD/MM/YYYY, DD-MM-YYYY, YYYY-MM-DD, DD.MM.YYYY, DD/MM/YY,
+        DD-MM-YY and YY-MM-DD (day-first wins when both readings are valid).
+        
         Args:
             date_str: Input date string
             
@@ -244,28 +364,42 @@ class WorkdayDataExtractor:
             Formatted date string
         """
         try:
-            # Try different date formats and convert to DD/MM/YYYY
-            date_formats = [
-                '%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d', '%d.%m.%Y',
-                '%d/%m/%y', '%d-%m-%y', '%y-%m-%d'
-            ]
+            candidates = []
+            
+            match = _DAY_FIRST_DATE_RE.fullmatch(date_str)
+            if match:
+                day, separator, month, year = match.groups()
+                # Dotted dates are only accepted with a four-digit year
+                if separator != '.' or len(year) == 4:
+                    candidates.append((year, month, day))
             
-            for fmt in date_formats:
+            match = _YEAR_FIRST_DATE_RE.fullmatch(date_str)
+            if match:
+                candidates.append(match.groups())
+            
+            for year, month, day in candidates:
+                year_value = int(year)
+                if len(year) == 2:
+                    # Same pivot as strptime's %y: 69-99 -> 19xx, 00-68 -> 20xx
+                    year_value += 2000 if year_value <= 68 else 1900
                 try:
-                    date_obj = datetime.strptime(date_str, fmt)
-                    return date_obj.strftime('%d/%m/%Y')
+                    date_obj = date(year_value, int(month), int(day))
                 except ValueError:
                     continue
+                return f"{date_obj.day:02d}/{date_obj.month:02d}/{date_obj.year:04d}"
             
             return date_str  # Return original if no format matches
         except Exception as e:
-            logger.warning(f"Date formatting failed for '{date_str}': {e}")
+            logger.warning("Date formatting failed for '%s': %s", date_str, e)
             return date_str
     
     def _format_time(self, time_str: str) -> str:
         """
         Format time string to HH:MM format.
         
+        Accepts HH:MM, HH:MM:SS and HH.MM, in 24-hour form or in 12-hour
+        form followed by AM/PM.
+        
         Args:
             time_str: Input time string
             
@@ -273,39 +407,45 @@ class WorkdayDataExtractor:
             Formatted time string
         """
         try:
-            # Try different time formats and convert to HH:MM
-            time_formats = [
-                '%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M:%S %p',
-                '%H.%M', '%I.%M %p'
-            ]
+            match = _TIME_RE.fullmatch(time_str)
+            if not match:
+                return time_str
             
-            for fmt in time_formats:
-                try:
-                    time_obj = datetime.strptime(time_str, fmt)
-                    return time_obj.strftime('%H:%M')
-                except ValueError:
-                    continue
+            hour, separator, minute, second, meridiem = match.groups()
+            hour, minute = int(hour), int(minute)
             
-            return time_str  # Return original if no format matches
+            # Seconds are only accepted with colon-separated times
+            if second is not None and (separator != ':' or int(second) > 59):
+                return time_str
+            if minute > 59:
+                return time_str
+            
+            if meridiem:
+                if not 1 <= hour <= 12:
+                    return time_str
+                hour = hour % 12 + (12 if meridiem.upper() == 'PM' else 0)
+            elif hour > 23:
+                return time_str
+            
+            return f"{hour:02d}:{minute:02d}"
         except Exception as e:
-            logger.warning(f"Time formatting failed for '{time_str}': {e}")
+            logger.warning("Time formatting failed for '%s': %s", time_str, e)
             return time_str
     
-    def _create_fallback_data(self, transcribed_text: str) -> Dict[str, Any]:
+    def _create_fallback_data(self, transcribed_text: str, reference_date: str = None) -> Dict[str, Any]:
         """
-        Create fallback data when extraction fails.
+        Create fallback data when extraction fails or is skipped.
         
         Args:
             transcribed_text: Original transcribed text
+            reference_date: Date of the recording in DD/MM/YYYY format (defaults to today)
             
         Returns:
-            Basic fallback data structure
+            Basic fallback data structure, as a FallbackWorkdayData
         """
-        logger.warning("Using fallback data structure due to extraction failure")
-        
-        return {
+        return FallbackWorkdayData({
             'day': '',
-            'date': datetime.now().strftime('%d/%m/%Y'),
+            'date': reference_date or datetime.now().strftime('%d/%m/%Y'),
             'start_time': '',
             'end_time': '',
             'project_name': '',
@@ -313,4 +453,4 @@ class WorkdayDataExtractor:
             'work_description': transcribed_text,  # Use original text as description
             'workers': '',
             'additional_notes': 'מידע חולץ אוטומטית - נדרש עיון ידני'
-        } 
\ No newline at end of file
+        }) 
\ No newline at end of file
@@ -3,10 +3,27 @@ Data management module for Shaliwood Voice Bot.
 Handles Google Sheets operations and data persistence.
 """
 import logging
-from .sheets import GoogleSheetsManager
+import threading
+from datetime import date
+from enum import Enum
+from pathlib import Path
+from .config import SHEETS_HEADERS_MARKER_FILE, SPREADSHEET_ID
 
 logger = logging.getLogger(__name__)
 
+# Buffered rows are written every FLUSH_INTERVAL_S seconds, or as soon as BATCH_MAX are waiting
+FLUSH_INTERVAL_S = 5.0
+BATCH_MAX = 50
+# Rows kept for retry while Google Sheets is failing; new saves are refused beyond this
+MAX_PENDING = 1000
+
+
+class SheetsSaveResult(Enum):
+    """Outcome of DataManager.save_workday_data."""
+    UNAVAILABLE = "unavailable"  # Google Sheets is disabled or failed to initialize
+    QUEUED = "queued"  # Buffered; written to Google Sheets by the background flush
+    FAILED = "failed"
+
 
 class DataManager:
     """Handles data persistence operations."""
@@ -15,44 +32,187 @@ class DataManager:
         """Initialize the data manager."""
         self.sheets_manager = None
         
+        # Write buffer for save_workday_data, drained by a background thread
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._stop_flushing = threading.Event()
+        self._flush_thread = None
+        
         if not disable_sheets:
             try:
+                # Imported here so --no-sheets runs never load the Google API client
+                from .sheets import GoogleSheetsManager
+                
                 self.sheets_manager = GoogleSheetsManager()
-                self.sheets_manager.setup_spreadsheet_headers()
+                self._setup_headers_once_a_day()
                 logger.info("Google Sheets initialized")
             except Exception as e:
                 logger.warning(f"Google Sheets not available: {e}")
         else:
             logger.info("Google Sheets disabled for testing")
     
-    def save_workday_data(self, workday_data: dict, raw_transcription: str = None, recording_date: str = None) -> bool:
+    def _setup_headers_once_a_day(self):
+        """
+        Verify the spreadsheet headers, at most once a day per spreadsheet.
+        
+        The last verification is recorded in a small marker file, so repeated
+        runs (e.g. cron jobs) skip the Sheets API round trip.
+        """
+        marker = Path(SHEETS_HEADERS_MARKER_FILE)
+        stamp = f"{SPREADSHEET_ID} {date.today().isoformat()}"
+        
+        try:
+            if marker.read_text(encoding='utf-8') == stamp:
+                logger.debug("Spreadsheet headers already verified today")
+                return
+        except OSError:
+            pass
+        
+        self.sheets_manager.setup_spreadsheet_headers()
+        
+        try:
+            marker.write_text(stamp, encoding='utf-8')
+        except OSError as e:
+            logger.warning(f"Failed to write headers marker file: {e}")
+    
+    def save_workday_data(self, workday_data: dict, raw_transcription: str = None, recording_date: str = None) -> SheetsSaveResult:
         """
-        Save workday data to Google Sheets.
+        Queue workday data for saving to Google Sheets.
+        
+        Rows are buffered and written together by a background thread, so the
+        caller never waits on the Sheets API. Rows whose write fails are kept
+        and retried on the next flush. Call close() to flush on shutdown.
         
         Args:
             workday_data: Dictionary containing extracted workday information
             raw_transcription: Raw transcription text (optional)
             recording_date: Date when the voice message was recorded (optional)
+            
+        Returns:
+            SheetsSaveResult: QUEUED if the data was queued for saving, UNAVAILABLE
+            if Google Sheets is not available, FAILED if there was nothing to save
+            or the buffer is full of rows waiting for a retry
         """
-        if not self.sheets_manager or not workday_data:
+        if not self.sheets_manager:
+            return SheetsSaveResult.UNAVAILABLE
+        if not workday_data:
+            return SheetsSaveResult.FAILED
+        
+        with self._pending_lock:
+            if len(self._pending) >= MAX_PENDING:
+                logger.error(f"Sheets write buffer full ({MAX_PENDING} rows), refusing new row")
+                return SheetsSaveResult.FAILED
+            self._pending.append((workday_data, raw_transcription, recording_date))
+            pending_count = len(self._pending)
+            if self._flush_thread is None or not self._flush_thread.is_alive():
+                self._flush_thread = threading.Thread(target=self._flush_loop, name="sheets-flush", daemon=True)
+                self._flush_thread.start()
+        
+        if pending_count >= BATCH_MAX:
+            self._flush_event.set()
+        return SheetsSaveResult.QUEUED
+    
+    def _flush_loop(self):
+        """Background loop writing buffered rows until close() is called."""
+        while not self._stop_flushing.is_set():
+            self._flush_event.wait(FLUSH_INTERVAL_S)
+            self._flush_event.clear()
+            self._flush_pending()
+    
+    def _flush_pending(self) -> bool:
+        """
+        Write all buffered rows to Google Sheets in a single request.
+        
+        Rows that fail with a transient error (rate limiting, 5xx, network) are
+        put back at the front of the buffer for the next flush; beyond
+        MAX_PENDING the oldest ones are dropped. When Sheets rejects the batch
+        outright, the rows are retried one at a time so only the rejected ones
+        are dropped.
+        
+        Returns:
+            bool: True if every buffered row was saved (or none were waiting), False otherwise
+        """
+        with self._pending_lock:
+            records, self._pending = self._pending, []
+        if not records:
+            return True
+        
+        try:
+            self.sheets_manager.add_workday_summaries(records)
+            return True
+        except Exception as e:
+            if self._is_retriable(e):
+                logger.warning(f"Failed to save {len(records)} buffered rows to sheets, will retry: {e}")
+                self._requeue(records)
+                return False
+            if len(records) == 1:
+                logger.error(f"Dropping row rejected by sheets: {e}")
+                return False
+            logger.warning(f"Sheets rejected {len(records)} buffered rows, saving them one at a time: {e}")
+        
+        # Find the rows Sheets rejects; the rest are saved or kept for retry
+        all_saved = True
+        for index, record in enumerate(records):
+            try:
+                self.sheets_manager.add_workday_summaries([record])
+            except Exception as e:
+                all_saved = False
+                if self._is_retriable(e):
+                    logger.warning(f"Failed to save {len(records) - index} buffered rows to sheets, will retry: {e}")
+                    self._requeue(records[index:])
+                    break
+                logger.error(f"Dropping row rejected by sheets: {e}")
+        return all_saved
+    
+    @staticmethod
+    def _is_retriable(error: Exception) -> bool:
+        """Check whether a failed Sheets write may succeed if sent again."""
+        # Loaded only once Sheets is in use, like GoogleSheetsManager itself
+        from .sheets import StorageError
+        
+        return isinstance(error, StorageError) and error.retriable
+    
+    def _requeue(self, records: list):
+        """Put rows back at the front of the buffer, dropping the oldest beyond MAX_PENDING."""
+        with self._pending_lock:
+            self._pending[:0] = records
+            overflow = len(self._pending) - MAX_PENDING
+            if overflow > 0:
+                del self._pending[:overflow]
+        if overflow > 0:
+            logger.error(f"Sheets write buffer full, dropped {overflow} oldest rows")
+    
+    def close(self):
+        """Flush buffered rows and stop the background flush thread."""
+        with self._pending_lock:
+            thread, self._flush_thread = self._flush_thread, None
+        if thread is None:
+            return
+        
+        self._stop_flushing.set()
+        self._flush_event.set()
+        thread.join()
+        # Rows queued while the thread was finishing
+        self._flush_pending()
+        if self._pending:
+            logger.error(f"{len(self._pending)} rows could not be saved to sheets before closing")
+        # Later saves start a new flush thread
+        self._stop_flushing.clear()
+    
+    def save_workday_data_bulk(self, records: list) -> bool:
+        """
+        Save several workday records to Google Sheets in a single request.
+        
+        Args:
+            records: List of (workday_data, raw_transcription, recording_date) tuples
+        """
+        records = [record for record in records if record[0]]
+        if not self.sheets_manager or not records:
             return False
         
         try:
-            # Enrich workday data with business-specific fields
-            enriched_data = workday_data.copy()
-            
-            # Add raw transcription if provided
-            if raw_transcription:
-                enriched_data['raw_transcription'] = raw_transcription
-            
-            # Add recording date if provided
-            if recording_date:
-                enriched_data['recording_date'] = recording_date
-            
-            # Add default status
-            enriched_data['status'] = '⏳ ממתין לאישור'
-            
-            success = self.sheets_manager.add_workday_summary(enriched_data)
+            success = self.sheets_manager.add_workday_summaries(records)
             return success
         except Exception as e:
             logger.warning(f"Failed to save to sheets: {e}")
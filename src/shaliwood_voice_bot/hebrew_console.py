@@ -5,6 +5,17 @@ Handles proper Hebrew text formatting for terminal output.
 import unicodedata
 import re
 
+# Any character of the Hebrew Unicode block (U+0590-U+05FF)
+_HEBREW_RE = re.compile('[\u0590-\u05FF]')
+# Maximal runs of Hebrew or of non-Hebrew characters
+_HEBREW_SEG_RE = re.compile('[\u0590-\u05FF]+|[^\u0590-\u05FF]+')
+# Marks that attach to the preceding character: Hebrew niqqud and cantillation,
+# generic combining diacritics, variation selectors and emoji skin tones
+_MARKS = '\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7\u0300-\u036F\uFE00-\uFE0F\U0001F3FB-\U0001F3FF'
+_MARK_RE = re.compile(f'[{_MARKS}]')
+# A base character followed by its marks (approximates a grapheme cluster)
+_GRAPHEME_RE = re.compile(f'.[{_MARKS}]*', re.DOTALL)
+
 
 def format_hebrew_for_console(text: str) -> str:
     """
@@ -22,10 +33,19 @@ def format_hebrew_for_console(text: str) -> str:
     if not text:
         return text
     
+    # ASCII text (keys, numbers, dates) never needs RTL handling
+    if text.isascii():
+        return text
+    
     # Check if text contains Hebrew characters
     if not _contains_hebrew(text):
         return text
     
+    # A single Hebrew word (no whitespace at all) needs no split and join;
+    # isprintable() is False for tabs, newlines and non-ASCII spaces
+    if ' ' not in text and text.isprintable():
+        return _reverse_graphemes(text)
+    
     # Split into words and process each word
     words = text.split()
     formatted_words = []
@@ -33,7 +53,7 @@ def format_hebrew_for_console(text: str) -> str:
     for word in words:
         if _contains_hebrew(word):
             # For Hebrew words, reverse the character order
-            formatted_words.append(word[::-1])
+            formatted_words.append(_reverse_graphemes(word))
         else:
             # Keep non-Hebrew words as is
             formatted_words.append(word)
@@ -41,14 +61,18 @@ def format_hebrew_for_console(text: str) -> str:
     return ' '.join(formatted_words)
 
 
+def _reverse_graphemes(word: str) -> str:
+    """Reverse a word, keeping combining marks (e.g. niqqud) after their base letter."""
+    if _MARK_RE.search(word) is None:
+        return word[::-1]
+    return ''.join(reversed(_GRAPHEME_RE.findall(word)))
+
+
 def _contains_hebrew(text: str) -> bool:
     """Check if text contains Hebrew characters."""
-    hebrew_range = range(0x0590, 0x05FF + 1)  # Hebrew Unicode range
-    
-    for char in text:
-        if ord(char) in hebrew_range:
-            return True
-    return False
+    if text.isascii():
+        return False
+    return _HEBREW_RE.search(text) is not None
 
 
 def _split_hebrew_segments(text: str) -> list:
@@ -61,31 +85,7 @@ def _split_hebrew_segments(text: str) -> list:
     Returns:
         List of segments (Hebrew and non-Hebrew alternating)
     """
-    segments = []
-    current_segment = ""
-    current_is_hebrew = None
-    
-    for char in text:
-        char_is_hebrew = ord(char) in range(0x0590, 0x05FF + 1)
-        
-        # Initialize on first character
-        if current_is_hebrew is None:
-            current_is_hebrew = char_is_hebrew
-            current_segment = char
-        # Continue current segment if same type
-        elif char_is_hebrew == current_is_hebrew:
-            current_segment += char
-        # Switch to new segment if different type
-        else:
-            segments.append(current_segment)
-            current_segment = char
-            current_is_hebrew = char_is_hebrew
-    
-    # Add the last segment
-    if current_segment:
-        segments.append(current_segment)
-    
-    return segments
+    return _HEBREW_SEG_RE.findall(text)
 
 
 def format_hebrew_data_for_console(data: dict) -> dict:
@@ -96,16 +96,18 @@ def format_hebrew_data_for_console(data: dict) -> dict:
         data: Dictionary containing Hebrew text values
         
     Returns:
-        Dictionary with formatted Hebrew text values
+        Dictionary with formatted Hebrew text values (the input dictionary
+        itself when no value contains Hebrew)
     """
     if not data:
         return data
     
-    formatted_data = {}
+    # Copy only once a value actually needs rewriting
+    formatted_data = None
     for key, value in data.items():
-        if isinstance(value, str):
+        if isinstance(value, str) and _contains_hebrew(value):
+            if formatted_data is None:
+                formatted_data = dict(data)
             formatted_data[key] = format_hebrew_for_console(value)
-        else:
-            formatted_data[key] = value
     
-    return formatted_data 
\ No newline at end of file
+    return data if formatted_data is None else formatted_data 
\ No newline at end of file
@@ -2,12 +2,13 @@
 Local file processor module for Shaliwood Voice Bot.
 Handles local audio file processing for testing purposes.
 """
+import asyncio
 import logging
 import os
-from datetime import datetime
+import time
 from .voice_processor import VoiceProcessor
 from .data_manager import DataManager
-from .response_formatter import ResponseFormatter
+from .response_formatter import format_console_workday_data
 from .hebrew_console import format_hebrew_for_console, format_hebrew_data_for_console
 
 logger = logging.getLogger(__name__)
@@ -16,11 +17,10 @@ logger = logging.getLogger(__name__)
 class LocalProcessor:
     """Handles local audio file processing for testing."""
     
-    def __init__(self, voice_processor: VoiceProcessor, data_manager: DataManager, response_formatter: ResponseFormatter):
+    def __init__(self, voice_processor: VoiceProcessor, data_manager: DataManager):
         """Initialize the local processor."""
         self.voice_processor = voice_processor
         self.data_manager = data_manager
-        self.response_formatter = response_formatter
     
     def process_audio_file(self, audio_file_path: str, transcribe_only: bool = False, output_file: str = None):
         """Process a local audio file for testing purposes."""
@@ -31,18 +31,15 @@ class LocalProcessor:
         try:
             logger.info(f"Processing local audio file: {audio_file_path}")
             
-            # Get file creation date for reference
-            file_stat = os.stat(audio_file_path)
-            file_creation_time = file_stat.st_ctime
-            reference_date = datetime.fromtimestamp(file_creation_time).strftime('%d/%m/%Y')
-            logger.info(f"File creation date: {reference_date}")
+            # Get the file's modification date for reference (st_ctime is the
+            # inode change time on Linux, not the recording date)
+            reference_date = time.strftime('%d/%m/%Y', time.localtime(os.path.getmtime(audio_file_path)))
+            logger.info(f"File modification date: {reference_date}")
             
             # Process audio using voice processor
             # Note: save_for_testing=False ensures that voice messages are never saved,
             # regardless of the SAVE_VOICE_MESSAGES environment variable setting
-            success, text, workday_data = self.voice_processor.process_audio(
-                audio_file_path, save_for_testing=False, reference_date=reference_date
-            )
+            success, text, workday_data = asyncio.run(self._process_audio(audio_file_path, reference_date))
             
             if not success:
                 print("❌ Error processing audio file")
@@ -50,8 +47,7 @@ class LocalProcessor:
             
             # Format Hebrew text for console display
             formatted_text = format_hebrew_for_console(text)
-            print(f"\n📝 Transcription:")
-            print(f"{formatted_text}\n")
+            print(f"\n📝 Transcription:\n{formatted_text}\n")
             
             # Save transcription to file if requested (save original text, not formatted)
             if output_file:
@@ -82,20 +78,28 @@ class LocalProcessor:
             logger.error(f"Failed to save transcription to file: {e}")
             print(f"❌ Failed to save transcription to file: {e}")
     
+    async def _process_audio(self, audio_file_path: str, reference_date: str):
+        """Process the audio file, releasing the voice processor's loop-bound state afterwards."""
+        try:
+            return await self.voice_processor.process_audio(
+                audio_file_path, save_for_testing=False, reference_date=reference_date
+            )
+        finally:
+            await self.voice_processor.aclose()
+    
     def _handle_workday_data(self, workday_data: dict, raw_transcription: str = None, recording_date: str = None):
         """Handle workday data processing and display."""
         if workday_data:
             try:
                 # Try to save to sheets
-                sheets_available = self.data_manager.is_sheets_available()
-                sheets_saved = self.data_manager.save_workday_data(workday_data, raw_transcription, recording_date=recording_date)
+                save_result = self.data_manager.save_workday_data(workday_data, raw_transcription, recording_date=recording_date)
                 
                 # Format Hebrew data for console display
                 formatted_data = format_hebrew_data_for_console(workday_data)
                 
                 # Format and display the result
-                result = self.response_formatter.format_console_workday_data(
-                    formatted_data, sheets_available, sheets_saved
+                result = format_console_workday_data(
+                    formatted_data, save_result
                 )
                 print(result)
                     
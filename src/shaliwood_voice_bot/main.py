@@ -6,11 +6,6 @@ import logging
 import sys
 import argparse
 from .config import LOG_LEVEL, ConfigError
-from .voice_processor import VoiceProcessor
-from .data_manager import DataManager
-from .response_formatter import ResponseFormatter
-from .telegram_bot import TelegramBot
-from .local_processor import LocalProcessor
 
 # Configure logging
 logging.basicConfig(
@@ -25,16 +20,23 @@ class ShaliwoodBot:
     
     def __init__(self, disable_sheets: bool = False):
         """Initialize the bot application."""
+        # Imported here so --help and argument errors don't load the OpenAI client
+        from .voice_processor import VoiceProcessor
+        from .data_manager import DataManager
+        from .local_processor import LocalProcessor
+        
         self.voice_processor = VoiceProcessor()
         self.data_manager = DataManager(disable_sheets=disable_sheets)
-        self.response_formatter = ResponseFormatter()
-        self.telegram_bot = TelegramBot(self.voice_processor, self.data_manager, self.response_formatter)
-        self.local_processor = LocalProcessor(self.voice_processor, self.data_manager, self.response_formatter)
+        self.local_processor = LocalProcessor(self.voice_processor, self.data_manager)
     
     def run_telegram_bot(self, use_polling: bool = False):
         """Run the Telegram bot."""
         logger.info("Starting Telegram bot...")
-        self.telegram_bot.run(use_polling=use_polling)
+        # Imported here so local file processing doesn't load the Telegram stack
+        from .telegram_bot import TelegramBot
+        
+        telegram_bot = TelegramBot(self.voice_processor, self.data_manager)
+        telegram_bot.run(use_polling=use_polling)
     
     def process_local_file(self, audio_file_path: str, transcribe_only: bool = False, output_file: str = None):
         """Process a local audio file."""
@@ -43,6 +45,10 @@ class ShaliwoodBot:
             audio_file_path, transcribe_only=transcribe_only, output_file=output_file
         )
         return success
+    
+    def close(self):
+        """Flush pending work before the application exits."""
+        self.data_manager.close()
 
 
 def main():
@@ -56,6 +62,7 @@ def main():
     
     args = parser.parse_args()
     
+    bot = None
     try:
         bot = ShaliwoodBot(disable_sheets=args.no_sheets)
         
@@ -83,6 +90,9 @@ def main():
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         sys.exit(1)
+    finally:
+        if bot:
+            bot.close()
 
 
 if __name__ == "__main__":
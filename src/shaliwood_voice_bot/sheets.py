@@ -1,22 +1,39 @@
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
+import httplib2
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import os
-import json
+import random
+import time
 from .config import GOOGLE_SHEETS_CREDENTIALS_FILE, SPREADSHEET_ID
 
 logger = logging.getLogger(__name__)
 
 # Simple custom exception
 class StorageError(Exception):
-    """Raised when storage operations fail."""
-    pass
+    """
+    Raised when storage operations fail.
+    
+    ``retriable`` is True for transient failures (rate limiting, 5xx, network
+    errors) that may succeed if the same request is sent again later.
+    """
+    
+    def __init__(self, message: str, retriable: bool = False):
+        super().__init__(message)
+        self.retriable = retriable
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
+# Retries for rate-limited (429) and 5xx responses; googleapiclient backs off
+# exponentially with jitter between attempts
+API_NUM_RETRIES = 5
+# values.append is not idempotent (a 5xx may arrive after the rows were written),
+# so appends are retried only when rate-limited
+_RATE_LIMITED_STATUS = 429
+
 # Hebrew column mapping for the spreadsheet
 HEBREW_COLUMNS = {
     'day': 'יום',
@@ -33,6 +50,17 @@ HEBREW_COLUMNS = {
     'status': 'סטטוס'
 }
 
+# Header row and workday data keys, both in spreadsheet column order
+_HEADER_ROW = list(HEBREW_COLUMNS.values())
+_ROW_KEYS = tuple(HEBREW_COLUMNS)
+# Columns filled from _build_row arguments rather than the workday data
+_RECORDING_DATE_COL = _ROW_KEYS.index('recording_date')
+_RAW_TRANSCRIPTION_COL = _ROW_KEYS.index('raw_transcription')
+_STATUS_COL = _ROW_KEYS.index('status')
+
+# Status given to every new row until it is reviewed
+DEFAULT_STATUS = '⏳ ממתין לאישור'
+
 class GoogleSheetsManager:
     """
     Google Sheets manager for storing workday data.
@@ -83,15 +111,14 @@ class GoogleSheetsManager:
             result = self.service.spreadsheets().values().get(
                 spreadsheetId=SPREADSHEET_ID,
                 range='A1:L1'
-            ).execute()
+            ).execute(num_retries=API_NUM_RETRIES)
             
             values = result.get('values', [])
             
-            if not values or len(values[0]) < 12:
+            if not values or len(values[0]) < len(_HEADER_ROW):
                 # Headers don't exist or are incomplete, add them
-                headers = list(HEBREW_COLUMNS.values())
                 body = {
-                    'values': [headers]
+                    'values': [_HEADER_ROW]
                 }
                 
                 self.service.spreadsheets().values().update(
@@ -99,7 +126,7 @@ class GoogleSheetsManager:
                     range='A1:L1',
                     valueInputOption='RAW',
                     body=body
-                ).execute()
+                ).execute(num_retries=API_NUM_RETRIES)
                 
                 logger.info("Spreadsheet headers set up successfully")
             else:
@@ -112,12 +139,33 @@ class GoogleSheetsManager:
             logger.error(f"Unexpected error setting up headers: {e}")
             raise StorageError(f"Headers setup failed: {e}")
     
-    def add_workday_summary(self, workday_data: Dict[str, Any]) -> bool:
+    def add_workday_summary(self, workday_data: Dict[str, Any], *, raw_transcription: str = '',
+                            recording_date: str = '', status: str = DEFAULT_STATUS) -> bool:
         """
         Add a new workday summary row to the spreadsheet.
         
         Args:
             workday_data: Dictionary containing the workday information
+            raw_transcription: Raw transcription text for the row
+            recording_date: Date when the voice message was recorded
+            status: Review status for the row
+            
+        Returns:
+            bool: True if successful, False otherwise
+            
+        Raises:
+            StorageError: If storage operation fails
+        """
+        return self.add_workday_summaries([(workday_data, raw_transcription, recording_date)], status=status)
+    
+    def add_workday_summaries(self, records: List[Tuple[Dict[str, Any], str, str]], *,
+                              status: str = DEFAULT_STATUS) -> bool:
+        """
+        Add several workday summary rows to the spreadsheet in a single request.
+        
+        Args:
+            records: (workday_data, raw_transcription, recording_date) tuples, one per row
+            status: Review status for every row
             
         Returns:
             bool: True if successful, False otherwise
@@ -126,56 +174,69 @@ class GoogleSheetsManager:
             StorageError: If storage operation fails
         """
         try:
-            if not workday_data:
+            if not records or not all(workday_data for workday_data, _, _ in records):
                 raise StorageError("No workday data provided")
             
             # Prepare the row data in the correct order
-            row_data = [
-                workday_data.get('day', ''),
-                workday_data.get('date', ''),
-                workday_data.get('recording_date', ''),
-                workday_data.get('start_time', ''),
-                workday_data.get('end_time', ''),
-                workday_data.get('project_name', ''),
-                workday_data.get('sub_project', ''),
-                workday_data.get('work_description', ''),
-                workday_data.get('workers', ''),
-                workday_data.get('additional_notes', ''),
-                workday_data.get('raw_transcription', ''),  # Set by business layer
-                workday_data.get('status', '⏳ ממתין לאישור')  # Set by business layer
+            rows = [
+                self._build_row(workday_data, raw_transcription or '', recording_date or '', status)
+                for workday_data, raw_transcription, recording_date in records
             ]
             
-            # Find the next empty row
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=SPREADSHEET_ID,
-                range='A:A'
-            ).execute()
-            
-            values = result.get('values', [])
-            next_row = len(values) + 1
-            
-            # Add the new row
+            # Append after the last row of the table; the server picks the rows
             body = {
-                'values': [row_data]
+                'values': rows
             }
             
-            self.service.spreadsheets().values().update(
+            result = self._execute_append(self.service.spreadsheets().values().append(
                 spreadsheetId=SPREADSHEET_ID,
-                range=f'A{next_row}:L{next_row}',
+                range='A:L',
                 valueInputOption='RAW',
+                insertDataOption='INSERT_ROWS',
                 body=body
-            ).execute()
+            ))
             
-            logger.info(f"Successfully added workday summary to row {next_row}")
+            updated_range = result.get('updates', {}).get('updatedRange', '')
+            logger.info(f"Successfully added {len(rows)} workday summaries at {updated_range}")
             return True
             
         except HttpError as error:
             logger.error(f"Error adding workday summary: {error}")
-            raise StorageError(f"Data storage failed: {error}")
+            status = error.resp.status
+            raise StorageError(
+                f"Data storage failed: {error}", retriable=status == _RATE_LIMITED_STATUS or status >= 500
+            )
+        except (OSError, httplib2.HttpLib2Error) as e:
+            logger.error(f"Network error adding workday summary: {e}")
+            raise StorageError(f"Data storage failed: {e}", retriable=True)
         except Exception as e:
             logger.error(f"Unexpected error adding workday summary: {e}")
             raise StorageError(f"Data storage failed: {e}")
     
+    def _execute_append(self, request) -> Dict[str, Any]:
+        """
+        Execute an append request, retrying only rate-limited (429) responses.
+        
+        Rejected requests are never applied, so retrying them can't duplicate
+        rows; other errors are raised to the caller after the first attempt.
+        """
+        for attempt in range(API_NUM_RETRIES + 1):
+            try:
+                return request.execute()
+            except HttpError as error:
+                if error.resp.status != _RATE_LIMITED_STATUS or attempt == API_NUM_RETRIES:
+                    raise
+                # Same randomized exponential backoff as googleapiclient's num_retries
+                time.sleep(random.random() * 2 ** attempt)
+    
+    def _build_row(self, workday_data: Dict[str, Any], raw_transcription: str, recording_date: str, status: str) -> List[Any]:
+        """Build a spreadsheet row from workday data, in column order."""
+        row = [workday_data.get(key, '') for key in _ROW_KEYS]
+        row[_RECORDING_DATE_COL] = recording_date
+        row[_RAW_TRANSCRIPTION_COL] = raw_transcription
+        row[_STATUS_COL] = status
+        return row
+    
     def get_spreadsheet_info(self) -> Dict[str, Any]:
         """
         Get basic information about the spreadsheet.
@@ -189,7 +250,7 @@ class GoogleSheetsManager:
         try:
             spreadsheet = self.service.spreadsheets().get(
                 spreadsheetId=SPREADSHEET_ID
-            ).execute()
+            ).execute(num_retries=API_NUM_RETRIES)
             
             return {
                 'title': spreadsheet['properties']['title'],
@@ -2,34 +2,95 @@
 Telegram bot module for Shaliwood Voice Bot.
 Handles Telegram-specific operations and message handling.
 """
+import asyncio
+import functools
 import logging
-import tempfile
-import os
+import re
 from telegram import Update
 from telegram.ext import Application, MessageHandler, filters, ContextTypes, CommandHandler
 from .config import TELEGRAM_TOKEN, WEBHOOK_URL, WEBHOOK_PORT, WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_SECRET
 from .config import SAVE_VOICE_MESSAGES
 from .voice_processor import VoiceProcessor
 from .data_manager import DataManager
-from .response_formatter import ResponseFormatter
+from .response_formatter import format_complete_workday_data
 
 logger = logging.getLogger(__name__)
 
+# Update filters, built once at import
+_VOICE_FILTER = filters.VOICE
+_TEXT_FILTER = filters.TEXT & ~filters.COMMAND
+_COMMAND_FILTER = filters.COMMAND
+# Plain-text help requests, matched by the dispatcher instead of in handle_text_message
+_HELP_TEXT_FILTER = _TEXT_FILTER & filters.Regex(re.compile(r"^\s*(help|עזרה|התחלה)\s*$", re.IGNORECASE))
+
+# Fixed replies for /start and /help
+_WELCOME_TEXT = """
+🤖 ברוכים הבאים ל-Shaliwood Voice Bot!
+
+🎤 איך להשתמש בבוט:
+• שלח הקלטת קול עם תיאור יום העבודה שלך
+• הבוט יחלץ את המידע ויוסיף אותו לגיליון האלקטרוני
+• הבוט יציג את כל הנתונים השמורים בגיליון בתגובה
+
+📊 מידע נוסף:
+• השתמש בפקודה /help לקבלת עזרה
+
+🚀 התחל על ידי שליחת הקלטת קול!
+        """
+
+_HELP_TEXT = """
+🤖 Shaliwood Voice Bot - עזרה
+
+📝 איך להשתמש:
+• שלח הקלטת קול עם תיאור יום העבודה
+• הבוט יחלץ את המידע ויוסיף אותו לגיליון האלקטרוני
+• הבוט יציג את כל הנתונים השמורים בגיליון בתגובה
+
+🎤 פקודות זמינות:
+• /help - הצגת עזרה זו
+        """
+
 
 class TelegramBot:
     """Handles Telegram bot operations."""
     
-    def __init__(self, voice_processor: VoiceProcessor, data_manager: DataManager, response_formatter: ResponseFormatter):
+    def __init__(self, voice_processor: VoiceProcessor, data_manager: DataManager):
         """Initialize the Telegram bot."""
         self.voice_processor = voice_processor
         self.data_manager = data_manager
-        self.response_formatter = response_formatter
-        self.application = None
+        # Voice messages waiting per chat, each chat drained by its own worker task
+        self._chat_queues: dict = {}
     
     async def handle_voice_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle incoming voice message from Telegram."""
-        temp_file_path = None
+        """
+        Queue an incoming voice message for its chat's worker.
         
+        Messages of one chat are processed in the order they arrived, while
+        different chats are processed concurrently.
+        """
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        queue = self._chat_queues.get(chat_id)
+        if queue is None:
+            queue = self._chat_queues[chat_id] = asyncio.Queue()
+            # Tasks created through the application are awaited when it stops
+            context.application.create_task(self._chat_worker(chat_id, queue))
+        queue.put_nowait((update, context))
+    
+    async def _chat_worker(self, chat_id, queue: asyncio.Queue):
+        """Process one chat's queued voice messages, exiting once the queue is empty."""
+        try:
+            while not queue.empty():
+                update, context = queue.get_nowait()
+                try:
+                    await self._process_voice_message(update, context)
+                except Exception as e:
+                    # e.g. the error reply itself failed; keep draining the chat's queue
+                    logger.error("Error processing queued voice message for chat %s: %s", chat_id, e)
+        finally:
+            del self._chat_queues[chat_id]
+    
+    async def _process_voice_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Process a voice message from Telegram and reply with the results."""
         try:
             # Validate input
             if not update.message or not update.message.voice:
@@ -38,72 +99,72 @@ class TelegramBot:
             # Extract message date for reference
             message_date = update.message.date
             reference_date = message_date.strftime('%d/%m/%Y') if message_date else None
-            logger.info(f"Voice message date: {reference_date}")
+            logger.info("Voice message date: %s", reference_date)
             
-            # Inform user that recording was received
-            await update.message.reply_text("✅ ההקלטה התקבלה, מעבד...")
-
-            # Download voice file
+            # Inform user that recording was received while the voice file downloads
             voice = update.message.voice
-            file = await context.bot.get_file(voice.file_id)
-            
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".ogg")
-            temp_file_path = temp_file.name
-            temp_file.close()
-            
-            await file.download_to_drive(temp_file_path)
-            logger.info(f"Voice file downloaded: {temp_file_path}")
+            _, audio_bytes = await asyncio.gather(
+                update.message.reply_text("✅ ההקלטה התקבלה, מעבד..."),
+                self._download_voice(voice, context)
+            )
             
-            # Process audio using voice processor
+            # Process audio using voice processor; its API calls are awaited, so
+            # other messages keep being handled meanwhile. The transcription is
+            # sent to the user while the workday data is being extracted
             # Only save voice messages if SAVE_VOICE_MESSAGES is enabled
             user_info = {'user_id': update.message.from_user.id if update.message.from_user else 'unknown'}
-            success, text, workday_data = self.voice_processor.process_audio(
-                temp_file_path, user_info, save_for_testing=SAVE_VOICE_MESSAGES, reference_date=reference_date
+            success, text, workday_data = await self.voice_processor.process_audio(
+                audio_bytes, user_info, save_for_testing=SAVE_VOICE_MESSAGES, reference_date=reference_date,
+                on_transcribed=lambda transcript: update.message.reply_text(f"הטקסט שזוהה:\n{transcript}"),
+                cache_key=voice.file_unique_id
             )
             
             if not success:
                 await update.message.reply_text("שגיאה בעיבוד ההקלטה")
                 return
             
-            # Send transcription
-            await update.message.reply_text(f"הטקסט שזוהה:\n{text}")
-            
             # Handle workday data
-            await self._handle_workday_data(update, workday_data, text)
+            await self._handle_workday_data(update, workday_data, text, reference_date)
                 
         except Exception as e:
-            logger.error(f"Error processing voice message: {e}")
+            logger.error("Error processing voice message: %s", e)
             await update.message.reply_text(f"שגיאה בעיבוד ההקלטה: {str(e)}")
-        finally:
-            # Clean up temporary file
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                    logger.debug(f"Temporary file cleaned up: {temp_file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to clean up temporary file: {e}")
     
-    async def _handle_workday_data(self, update: Update, workday_data: dict, raw_transcription: str = None):
+    async def _download_voice(self, voice, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Download a voice message into memory.
+        
+        Returns:
+            The voice file bytes, or None if the same recording was already
+            transcribed (Telegram keeps file_unique_id for re-sent and
+            forwarded voice messages)
+        """
+        if self.voice_processor.has_cached_transcription(voice.file_unique_id):
+            return None
+        
+        file = await context.bot.get_file(voice.file_id)
+        
+        # Keep the file in memory; it never touches the disk
+        audio_bytes = bytes(await file.download_as_bytearray())
+        logger.info("Voice file downloaded: %s bytes", len(audio_bytes))
+        return audio_bytes
+    
+    async def _handle_workday_data(self, update: Update, workday_data: dict, raw_transcription: str = None,
+                                   reference_date: str = None):
         """Handle workday data processing and response."""
         if workday_data:
             try:
-                # Get reference date from the message
-                reference_date = None
-                if update.message and update.message.date:
-                    reference_date = update.message.date.strftime('%d/%m/%Y')
-                
                 # Try to save to sheets
-                sheets_available = self.data_manager.is_sheets_available()
-                sheets_saved = self.data_manager.save_workday_data(workday_data, raw_transcription, recording_date=reference_date)
+                save_result = self.data_manager.save_workday_data(workday_data, raw_transcription, recording_date=reference_date)
                 
                 # Format and send the complete response with all extracted information
-                message = self.response_formatter.format_complete_workday_data(
-                    workday_data, sheets_available, sheets_saved
+                message = format_complete_workday_data(
+                    workday_data, save_result
                 )
                 await update.message.reply_text(message)
                 
             except Exception as e:
-                logger.warning(f"Data processing failed: {e}")
+                logger.warning("Data processing failed: %s", e)
                 await update.message.reply_text(f"שגיאה בעיבוד המידע: {str(e)}")
         else:
             await update.message.reply_text("⚠️ מערכת חילוץ המידע לא זמינה")
@@ -114,82 +175,81 @@ class TelegramBot:
             if not update.message or not update.message.text:
                 return
             
-            text = update.message.text.strip()
-            
-            # Handle commands
-            if text.lower() in ['/help', '/start', 'help', 'עזרה', 'התחלה']:
-                await self._handle_help(update)
-            else:
-                await update.message.reply_text("שלח הקלטת קול כדי להוסיף נתוני עבודה")
+            # Help requests are routed to _handle_help by their own handlers
+            await update.message.reply_text("שלח הקלטת קול כדי להוסיף נתוני עבודה")
                 
         except Exception as e:
-            logger.error(f"Error processing text message: {e}")
+            logger.error("Error processing text message: %s", e)
             await update.message.reply_text(f"שגיאה בעיבוד ההודעה: {str(e)}")
     
-    async def _handle_help(self, update: Update):
-        """Handle help command."""
-        help_text = """
-🤖 Shaliwood Voice Bot - עזרה
-
-📝 איך להשתמש:
-• שלח הקלטת קול עם תיאור יום העבודה
-• הבוט יחלץ את המידע ויוסיף אותו לגיליון האלקטרוני
-• הבוט יציג את כל הנתונים השמורים בגיליון בתגובה
-
-🎤 פקודות זמינות:
-• /help - הצגת עזרה זו
-        """
-        await update.message.reply_text(help_text)
+    async def _handle_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /help command and plain-text help requests."""
+        await update.message.reply_text(_HELP_TEXT)
     
-    def setup_handlers(self):
+    def setup_handlers(self, application: Application):
         """Setup message handlers."""
-        self.application.add_handler(
-            MessageHandler(filters.VOICE, self.handle_voice_message)
+        application.add_handler(
+            MessageHandler(_VOICE_FILTER, self.handle_voice_message)
+        )
+        application.add_handler(
+            MessageHandler(_HELP_TEXT_FILTER, self._handle_help)
         )
-        self.application.add_handler(
-            MessageHandler(filters.TEXT, self.handle_text_message)
+        application.add_handler(
+            MessageHandler(_TEXT_FILTER, self.handle_text_message)
         )
-        self.application.add_handler(
+        application.add_handler(
             CommandHandler("start", self._handle_start)
         )
+        application.add_handler(
+            CommandHandler("help", self._handle_help)
+        )
+        # Unknown commands get the same hint as other text
+        application.add_handler(
+            MessageHandler(_COMMAND_FILTER, self.handle_text_message)
+        )
     
     async def _handle_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command - welcome message."""
-        welcome_text = """
-🤖 ברוכים הבאים ל-Shaliwood Voice Bot!
-
-🎤 איך להשתמש בבוט:
-• שלח הקלטת קול עם תיאור יום העבודה שלך
-• הבוט יחלץ את המידע ויוסיף אותו לגיליון האלקטרוני
-• הבוט יציג את כל הנתונים השמורים בגיליון בתגובה
-
-📊 מידע נוסף:
-• השתמש בפקודה /help לקבלת עזרה
-
-🚀 התחל על ידי שליחת הקלטת קול!
-        """
-        await update.message.reply_text(welcome_text)
+        await update.message.reply_text(_WELCOME_TEXT)
+    
+    @functools.cached_property
+    def application(self) -> Application:
+        """The bot's Application, built with its handlers on first use and reused by every run()."""
+        # Updates are handled concurrently so one long voice message doesn't
+        # hold up everyone else's
+        application = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .concurrent_updates(True)
+            .post_shutdown(self._post_shutdown)
+            .build()
+        )
+        self.setup_handlers(application)
+        return application
+    
+    async def _post_shutdown(self, application: Application):
+        """Release the voice processor's HTTP connections when the bot stops."""
+        await self.voice_processor.aclose()
     
     def run(self, use_polling: bool = False):
-        """Run the Telegram bot in either polling or webhook mode."""
+        """
+        Run the Telegram bot in either polling or webhook mode.
+        
+        The event loop is left open when the bot stops, so run() can be called
+        again on the same Application; closing the loop is up to the caller.
+        """
         try:
-            # Create application
-            self.application = Application.builder().token(TELEGRAM_TOKEN).build()
-            
-            # Setup handlers
-            self.setup_handlers()
-            
             if use_polling:
                 logger.info("Starting Shaliwood Voice Bot in polling mode...")
-                self.application.run_polling()
+                self.application.run_polling(close_loop=False)
             else:
                 # Webhook mode (default)
                 if not WEBHOOK_URL:
                     logger.error("WEBHOOK_URL environment variable is required for webhook mode")
                     raise ValueError("WEBHOOK_URL environment variable is required for webhook mode")
                 
-                logger.info(f"Starting Shaliwood Voice Bot in webhook mode on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}")
-                logger.info(f"Webhook URL: {WEBHOOK_URL}{WEBHOOK_PATH}")
+                logger.info("Starting Shaliwood Voice Bot in webhook mode on %s:%s", WEBHOOK_LISTEN, WEBHOOK_PORT)
+                logger.info("Webhook URL: %s%s", WEBHOOK_URL, WEBHOOK_PATH)
                 
                 # Set webhook
                 self.application.run_webhook(
@@ -197,11 +257,12 @@ class TelegramBot:
                     port=WEBHOOK_PORT,
                     url_path=WEBHOOK_PATH,
                     webhook_url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
-                    secret_token=WEBHOOK_SECRET
+                    secret_token=WEBHOOK_SECRET,
+                    close_loop=False
                 )
             
         except KeyboardInterrupt:
             logger.info("Bot stopped by user")
         except Exception as e:
-            logger.error(f"Bot runtime error: {e}")
+            logger.error("Bot runtime error: %s", e)
             raise 
\ No newline at end of file
@@ -2,115 +2,479 @@
 Voice processing module for Shaliwood Voice Bot.
 Handles audio transcription and data extraction only.
 """
+import abc
+import asyncio
+import io
 import logging
 import os
 import shutil
-from datetime import datetime
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from openai import OpenAI
-from .config import OPENAI_API_KEY, VOICE_SAVE_DIR
-from .data_extractor import WorkdayDataExtractor
+from typing import Awaitable, Callable, Optional, Union
+import orjson
+from .config import COMPRESS_WHISPER_UPLOADS, ConfigError, LOCAL_WHISPER_DEVICE, LOCAL_WHISPER_MODEL, TRANSCRIPTION_CACHE_FILE, VOICE_SAVE_DIR, WHISPER_BACKEND
+from .data_extractor import FallbackWorkdayData, WorkdayDataExtractor, close_async_openai_client, get_async_openai_client
 
 logger = logging.getLogger(__name__)
 
+# Audio given to the processor: a file path, or the raw bytes of an OGG voice message
+AudioSource = Union[str, bytes]
+
+# Maximum number of Whisper transcriptions in flight at once, across all callers
+MAX_CONCURRENT_TRANSCRIPTIONS = 8
+
+# Batch size for faster-whisper's batched inference over the chunks of one recording
+LOCAL_WHISPER_BATCH_SIZE = 8
+
+# With COMPRESS_WHISPER_UPLOADS, voice messages at least this large are re-encoded
+# to 16 kHz mono Opus before upload
+UPLOAD_COMPRESS_MIN_BYTES = 32 * 1024
+_FFMPEG_COMPRESS_ARGS = (
+    "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+    "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "16k", "-f", "ogg", "pipe:1"
+)
+
+# Timestamp in the file names of saved testing copies
+_SAVE_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+# Number of recent transcriptions kept for re-sent or forwarded voice messages
+TRANSCRIPTION_CACHE_SIZE = 512
+
+
+class WhisperBackend(abc.ABC):
+    """Speech-to-text backend used by VoiceProcessor."""
+    
+    @abc.abstractmethod
+    async def transcribe(self, audio: AudioSource) -> str:
+        """
+        Transcribe Hebrew audio.
+        
+        Args:
+            audio: Path to the audio file, or the OGG voice message bytes
+            
+        Returns:
+            The transcribed text
+        """
+    
+    async def warmup(self):
+        """Pay one-off start-up costs (connections, model load) before real audio arrives."""
+
+
+class OpenAIAPIWhisper(WhisperBackend):
+    """Transcribes audio with the hosted OpenAI Whisper API."""
+    
+    def __init__(self):
+        """Initialize the backend; requests go through the shared async OpenAI client."""
+        # Uploads are compressed only when enabled and ffmpeg is available
+        self.ffmpeg_path = shutil.which("ffmpeg") if COMPRESS_WHISPER_UPLOADS else None
+    
+    async def transcribe(self, audio: AudioSource) -> str:
+        """Transcribe audio using the OpenAI Whisper endpoint."""
+        if isinstance(audio, str):
+            with open(audio, "rb") as audio_file:
+                transcript = await get_async_openai_client().audio.transcriptions.create(
+                    model="whisper-1",
+                    file=audio_file,
+                    language="he"
+                )
+        else:
+            # In-memory audio is uploaded with its name and MIME type
+            audio = await self._compress_for_upload(audio)
+            transcript = await get_async_openai_client().audio.transcriptions.create(
+                model="whisper-1",
+                file=("voice.ogg", audio, "audio/ogg"),
+                language="he"
+            )
+        
+        return transcript.text
+    
+    async def _compress_for_upload(self, audio: bytes) -> bytes:
+        """
+        Re-encode voice audio to 16 kHz mono Opus to shrink the upload.
+        
+        Whisper resamples to 16 kHz anyway, but this is a second lossy encode
+        at 16 kbit/s and its effect on transcription accuracy has not been
+        measured, so it only runs with COMPRESS_WHISPER_UPLOADS. Small payloads,
+        a missing ffmpeg or a failed encode all fall back to the original bytes.
+        """
+        if not self.ffmpeg_path or len(audio) < UPLOAD_COMPRESS_MIN_BYTES:
+            return audio
+        
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.ffmpeg_path, *_FFMPEG_COMPRESS_ARGS,
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            compressed, stderr = await process.communicate(audio)
+        except OSError as e:
+            logger.warning("ffmpeg unavailable, uploading original audio: %s", e)
+            self.ffmpeg_path = None
+            return audio
+        
+        if process.returncode != 0 or not compressed:
+            logger.warning("ffmpeg re-encode failed, uploading original audio: %s", stderr.decode(errors='replace').strip())
+            return audio
+        if len(compressed) >= len(audio):
+            return audio
+        
+        logger.info("Audio compressed for upload: %s -> %s bytes", len(audio), len(compressed))
+        return compressed
+    
+    async def warmup(self):
+        """Open the HTTPS connection to the API with a free metadata request."""
+        await get_async_openai_client().models.list()
+
+
+class FasterWhisperLocal(WhisperBackend):
+    """
+    Transcribes audio locally with faster-whisper (CTranslate2).
+    
+    Requires the optional ``faster-whisper`` dependency. Each recording is split
+    into chunks that are decoded in batches by BatchedInferencePipeline.
+    """
+    
+    def __init__(self, model_size: str = "small", device: str = "auto", compute_type: Optional[str] = None):
+        """
+        Load the local Whisper model.
+        
+        Weights are quantized to int8 on CPU and to int8_float16 on CUDA unless
+        a compute type is given explicitly.
+        
+        Args:
+            model_size: faster-whisper model name (e.g. "small", "medium")
+            device: "cpu", "cuda" or "auto" (CUDA when a GPU is visible)
+            compute_type: CTranslate2 compute type overriding the device default
+            
+        Raises:
+            ConfigError: If faster-whisper is not installed
+        """
+        try:
+            import ctranslate2
+            from faster_whisper import BatchedInferencePipeline, WhisperModel
+        except ImportError as e:
+            raise ConfigError(
+                "WHISPER_BACKEND=local requires the 'faster-whisper' package "
+                "(install with: poetry install -E local-whisper)"
+            ) from e
+        
+        if device == "auto":
+            device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+        if compute_type is None:
+            compute_type = "int8_float16" if device == "cuda" else "int8"
+        
+        self.model = WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=os.cpu_count() or 0)
+        self.pipeline = BatchedInferencePipeline(model=self.model)
+        # Inference already uses every core, so recordings are decoded one at a
+        # time on a dedicated thread; queued callers don't tie up the default
+        # executor that Sheets saves and testing copies run on
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper")
+        logger.info("Local Whisper model loaded: %s on %s (%s)", model_size, device, compute_type)
+    
+    async def transcribe(self, audio: AudioSource) -> str:
+        """Transcribe audio with the local Whisper model, on the model thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._transcribe_blocking, audio)
+    
+    def _transcribe_blocking(self, audio: AudioSource) -> str:
+        """Run the local Whisper model on the calling thread."""
+        if not isinstance(audio, str):
+            audio = io.BytesIO(audio)
+        
+        segments, _ = self.pipeline.transcribe(audio, language="he", batch_size=LOCAL_WHISPER_BATCH_SIZE)
+        return " ".join(segment.text.strip() for segment in segments)
+    
+    async def warmup(self):
+        """Run half a second of silence through the model to initialize its kernels."""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._warmup_blocking)
+    
+    def _warmup_blocking(self):
+        """Decode silence on the calling thread."""
+        import numpy as np
+        
+        segments, _ = self.model.transcribe(np.zeros(8000, dtype=np.float32), language="he")
+        list(segments)
+
+
+def create_whisper_backend(name: str = WHISPER_BACKEND) -> WhisperBackend:
+    """
+    Create the Whisper backend selected by configuration.
+    
+    Args:
+        name: Backend name, "openai" (hosted API) or "local" (faster-whisper)
+        
+    Raises:
+        ConfigError: If the backend name is unknown or the backend can't be created
+    """
+    if name == "openai":
+        return OpenAIAPIWhisper()
+    if name == "local":
+        return FasterWhisperLocal(model_size=LOCAL_WHISPER_MODEL, device=LOCAL_WHISPER_DEVICE)
+    raise ConfigError(f"Unknown WHISPER_BACKEND '{name}' (expected 'openai' or 'local')")
+
 
 class VoiceProcessor:
     """Handles audio transcription and data extraction."""
     
     def __init__(self):
         """Initialize the voice processor."""
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        self.whisper_backend = create_whisper_backend()
         self.data_extractor = None
+        # cache_key -> (text, reference_date, workday_data), least recently used first
+        self._transcription_cache = OrderedDict()
+        # Created on first use, inside the event loop that runs the transcriptions
+        # (reset by aclose() so a later loop gets its own)
+        self._transcription_semaphore = None
+        # Testing copies directory, created when the first copy is saved
+        self._save_dir = None
+        self._load_transcription_cache()
         
         try:
             self.data_extractor = WorkdayDataExtractor()
             logger.info("Data extractor initialized")
         except Exception as e:
-            logger.warning(f"Data extractor not available: {e}")
+            logger.warning("Data extractor not available: %s", e)
     
-    def process_audio(self, audio_file_path: str, user_info: dict = None, save_for_testing: bool = False, reference_date: str = None):
+    async def warmup(self):
+        """
+        Warm up the transcription backend and the async OpenAI client.
+        
+        Meant to run alongside other start-up I/O so the first real message
+        doesn't pay for connection setup or model initialization. Failures are
+        logged and otherwise ignored.
+        """
+        tasks = [self.whisper_backend.warmup()]
+        # The hosted Whisper backend already warms the shared async client
+        if self.data_extractor and not isinstance(self.whisper_backend, OpenAIAPIWhisper):
+            tasks.append(self.data_extractor.warmup_async())
+        
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.warning("Warmup failed: %s", result)
+    
+    async def aclose(self):
+        """
+        Persist the transcription cache and release the event-loop-bound state.
+        
+        Call at the end of every event loop the processor ran on. The shared
+        OpenAI connection pool is closed and the transcription semaphore
+        dropped; both are recreated on the next loop that uses the processor.
+        """
+        self._save_transcription_cache()
+        self._transcription_semaphore = None
+        await close_async_openai_client()
+    
+    def has_cached_transcription(self, cache_key: str) -> bool:
+        """Check whether audio with this cache key (e.g. a Telegram file_unique_id) was already transcribed."""
+        return cache_key in self._transcription_cache
+    
+    async def process_audio(self, audio: Optional[AudioSource], user_info: dict = None, save_for_testing: bool = False, reference_date: str = None,
+                            on_transcribed: Optional[Callable[[str], Awaitable]] = None, cache_key: str = None):
         """
         Core audio processing pipeline.
         
         Args:
-            audio_file_path: Path to the audio file to process
+            audio: Path to the audio file, or the OGG voice message bytes
             user_info: Dictionary with user information (for Telegram messages)
             save_for_testing: Whether to save the voice message for testing (decided by caller)
             reference_date: Reference date in DD/MM/YYYY format for data extraction
+            on_transcribed: Coroutine function called with the text as soon as it is
+                transcribed; it runs concurrently with data extraction (optional)
+            cache_key: Stable identifier of the audio (e.g. Telegram's file_unique_id).
+                Known keys reuse the cached transcription, and ``audio`` may be None;
+                the cached workday data is reused only for the same reference date
+                and only if it came from a successful extraction
             
         Returns:
             tuple: (success: bool, text: str, workday_data: dict)
         """
         try:
-            logger.info(f"Processing audio file: {audio_file_path}")
+            cached = self._transcription_cache.get(cache_key) if cache_key else None
+            if cached:
+                self._transcription_cache.move_to_end(cache_key)
+                text = cached[0]
+                logger.info("Reusing cached transcription for %s", cache_key)
+            else:
+                text = await self._save_and_transcribe(audio, user_info, save_for_testing)
+                if not text:
+                    return False, None, None
             
-            # Save voice message for testing if enabled (decided by caller)
-            if save_for_testing:
-                self._save_voice_for_testing(audio_file_path, user_info)
+            async def extract():
+                if cached and cached[1] == reference_date and cached[2]:
+                    return dict(cached[2])
+                return await self._extract_workday_data(text, reference_date)
             
-            # Transcribe audio
-            text = self._transcribe_audio(audio_file_path)
-            if not text:
-                return False, None, None
+            # Extract workday data, overlapping it with the caller's callback
+            if on_transcribed:
+                callback_result, workday_data = await asyncio.gather(
+                    on_transcribed(text), extract(), return_exceptions=True
+                )
+                if isinstance(callback_result, Exception):
+                    logger.warning("Transcription callback failed: %s", callback_result)
+                if isinstance(workday_data, Exception):
+                    raise workday_data
+            else:
+                workday_data = await extract()
             
-            # Extract workday data
-            workday_data = self._extract_workday_data(text, reference_date)
+            if cache_key:
+                # Fallback data (e.g. after an API error) is not kept, so a resent
+                # recording retries the extraction
+                if isinstance(workday_data, FallbackWorkdayData):
+                    workday_data_to_cache = None
+                else:
+                    workday_data_to_cache = workday_data
+                self._cache_transcription(cache_key, text, reference_date, workday_data_to_cache)
             
             return True, text, workday_data
                 
         except Exception as e:
-            logger.error(f"Error in audio processing: {e}")
+            logger.error("Error in audio processing: %s", e)
             return False, None, None
     
-    def _save_voice_for_testing(self, audio_file_path: str, user_info: dict = None):
+    async def process_audio_batch(self, audios: list, user_infos: list = None, save_for_testing: bool = False, reference_dates: list = None) -> list:
+        """
+        Run the audio processing pipeline over several files at once.
+        
+        Whisper transcriptions run concurrently (bounded by
+        MAX_CONCURRENT_TRANSCRIPTIONS), then all GPT extractions run
+        concurrently on the async client.
+        
+        Args:
+            audios: Paths or OGG bytes of the audio files to process
+            user_infos: Per-file user information dictionaries (optional)
+            save_for_testing: Whether to save the voice messages for testing (decided by caller)
+            reference_dates: Per-file reference dates in DD/MM/YYYY format (optional)
+            
+        Returns:
+            list: One (success, text, workday_data) tuple per file, in input order
+        """
+        if not audios:
+            return []
+        
+        count = len(audios)
+        user_infos = user_infos or [None] * count
+        reference_dates = reference_dates or [None] * count
+        
+        logger.info("Processing batch of %s audio files", count)
+        
+        # Transcription phase
+        texts = await asyncio.gather(*[
+            self._save_and_transcribe(audio, user_info, save_for_testing)
+            for audio, user_info in zip(audios, user_infos)
+        ])
+        
+        # Extraction phase (only for successful transcriptions)
+        extracted = iter(await asyncio.gather(*[
+            self._extract_workday_data(text, reference_date)
+            for text, reference_date in zip(texts, reference_dates) if text
+        ]))
+        
+        return [(True, text, next(extracted)) if text else (False, None, None) for text in texts]
+    
+    def _cache_transcription(self, cache_key: str, text: str, reference_date: str, workday_data: dict):
+        """Remember a transcription, evicting the least recently used one when full."""
+        self._transcription_cache[cache_key] = (text, reference_date, workday_data)
+        self._transcription_cache.move_to_end(cache_key)
+        if len(self._transcription_cache) > TRANSCRIPTION_CACHE_SIZE:
+            self._transcription_cache.popitem(last=False)
+    
+    def _load_transcription_cache(self):
+        """Load the transcription cache saved by a previous run, if configured."""
+        if not TRANSCRIPTION_CACHE_FILE:
+            return
+        
+        try:
+            entries = orjson.loads(Path(TRANSCRIPTION_CACHE_FILE).read_bytes())
+            for cache_key, text, reference_date, workday_data in entries[-TRANSCRIPTION_CACHE_SIZE:]:
+                self._transcription_cache[cache_key] = (text, reference_date, workday_data)
+            logger.info("Loaded %s cached transcriptions", len(self._transcription_cache))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Failed to load transcription cache: %s", e)
+    
+    def _save_transcription_cache(self):
+        """Write the transcription cache to disk, if configured."""
+        if not TRANSCRIPTION_CACHE_FILE:
+            return
+        
+        try:
+            entries = [[cache_key, *entry] for cache_key, entry in self._transcription_cache.items()]
+            Path(TRANSCRIPTION_CACHE_FILE).write_bytes(orjson.dumps(entries))
+            logger.info("Saved %s cached transcriptions", len(entries))
+        except Exception as e:
+            logger.warning("Failed to save transcription cache: %s", e)
+    
+    async def _save_and_transcribe(self, audio: AudioSource, user_info: dict = None, save_for_testing: bool = False) -> str:
+        """Transcribe the voice message, saving a testing copy alongside if requested."""
+        if isinstance(audio, str):
+            logger.info("Processing audio file: %s", audio)
+        else:
+            logger.info("Processing audio file: %s bytes in memory", len(audio))
+        
+        # Save voice message for testing if enabled (decided by caller); the
+        # blocking file write runs in a thread while the audio is transcribed
+        if save_for_testing:
+            _, text = await asyncio.gather(
+                asyncio.to_thread(self._save_voice_for_testing, audio, user_info),
+                self._transcribe_audio(audio)
+            )
+            return text
+        
+        # Transcribe audio
+        return await self._transcribe_audio(audio)
+    
+    def _save_voice_for_testing(self, audio: AudioSource, user_info: dict = None):
         """Save voice message for testing purposes."""
         try:
-            # Create save directory if it doesn't exist
-            save_dir = Path(VOICE_SAVE_DIR)
-            save_dir.mkdir(exist_ok=True)
+            # Create save directory on first use
+            if self._save_dir is None:
+                save_dir = Path(VOICE_SAVE_DIR)
+                save_dir.mkdir(exist_ok=True)
+                self._save_dir = save_dir
             
             # Generate filename with timestamp and user info
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = time.strftime(_SAVE_TIMESTAMP_FORMAT)
             user_id = user_info.get('user_id', 'unknown') if user_info else 'unknown'
             filename = f"voice_{user_id}_{timestamp}.ogg"
-            save_path = save_dir / filename
+            save_path = self._save_dir / filename
             
-            # Copy the file to the save directory
-            shutil.copy2(audio_file_path, save_path)
-            logger.info(f"Voice message saved for testing: {save_path}")
+            # Copy the file (or write the in-memory audio) to the save directory
+            if isinstance(audio, str):
+                shutil.copy2(audio, save_path)
+            else:
+                save_path.write_bytes(audio)
+            logger.info("Voice message saved for testing: %s", save_path)
             
         except Exception as e:
-            logger.warning(f"Failed to save voice message for testing: {e}")
+            logger.warning("Failed to save voice message for testing: %s", e)
     
-    def _transcribe_audio(self, audio_file_path: str) -> str:
-        """Transcribe audio file using OpenAI Whisper."""
+    async def _transcribe_audio(self, audio: AudioSource) -> str:
+        """Transcribe audio file using the configured Whisper backend."""
+        if self._transcription_semaphore is None:
+            self._transcription_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TRANSCRIPTIONS)
+        
         try:
-            with open(audio_file_path, "rb") as audio_file:
-                transcript = self.openai_client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="he"
-                )
-            
-            text = transcript.text
-            logger.info(f"Audio transcribed: {len(text)} characters")
+            async with self._transcription_semaphore:
+                text = await self.whisper_backend.transcribe(audio)
+            logger.info("Audio transcribed: %s characters", len(text))
             return text
             
         except Exception as e:
-            logger.error(f"Transcription failed: {e}")
+            logger.error("Transcription failed: %s", e)
             return None
     
-    def _extract_workday_data(self, text: str, reference_date: str = None) -> dict:
-        """Extract workday data from transcribed text."""
+    async def _extract_workday_data(self, text: str, reference_date: str = None) -> dict:
+        """Extract workday data from transcribed text using the async OpenAI client."""
         if not self.data_extractor:
             return None
         
         try:
             # Extract structured data from OpenAI
-            workday_data = self.data_extractor.extract_workday_data(text, reference_date)
+            workday_data = await self.data_extractor.extract_workday_data_async(text, reference_date)
             
-            logger.info(f"Workday data extracted: {len(workday_data)} fields")
+            logger.info("Workday data extracted: %s fields", len(workday_data))
             return workday_data
         except Exception as e:
-            logger.error(f"Data extraction failed: {e}")
-            return None 
\ No newline at end of file
+            logger.error("Data extraction failed: %s", e)
+            return None
\ No newline at end of file